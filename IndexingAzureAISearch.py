@@ -1,9 +1,14 @@
-import os, json, re
+import base64, os, re, time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+
+import numpy as np
 from dotenv import load_dotenv
 
+from jsonl_io import dump_line, iter_jsonl_lines, loads
+
 from azure.core.credentials import AzureKeyCredential
-from azure.core.exceptions import ResourceNotFoundError
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
 from azure.search.documents.indexes import SearchIndexClient
 from azure.search.documents.indexes.models import (
     SearchIndex, SimpleField, SearchField, SearchFieldDataType,
@@ -22,64 +27,128 @@ ENDPOINT  = os.environ["AZURE_SEARCH_SERVICE_ENDPOINT"]
 ADMIN_KEY = os.environ["AZURE_SEARCH_ADMIN_KEY"]
 INDEX     = os.getenv("AZURE_SEARCH_INDEX", "at2-index")
 
-# Helpers 
+# Helpers
+_RE_ID = re.compile(r"[^A-Za-z0-9_\-=]")
+
+# str.translate over a precomputed table beats the regex for the common
+# all-ASCII id; the table only covers ASCII, so anything else falls back
+_ID_TABLE = {
+    b: b if chr(b).isalnum() or chr(b) in "_-=" else ord("_")
+    for b in range(128)
+}
+
 def sanitize_id(raw: str) -> str:
     """Azure doc keys: only letters, digits, _, -, = . Replace others with _ ."""
     if not raw:
         return "missing_id"
-    safe = re.sub(r"[^A-Za-z0-9_\-=]", "_", raw)
+    if raw.isascii():
+        safe = raw.translate(_ID_TABLE)
+    else:
+        safe = _RE_ID.sub("_", raw)
     return safe[:512]
 
 def combine_jsonl(out_path: str, paths: list[str]) -> str:
     """Combine JSONL inputs; de-dup by sha1/id."""
     Path(out_path).parent.mkdir(parents=True, exist_ok=True)
     seen, wrote = set(), 0
-    with open(out_path, "w", encoding="utf-8") as out:
+    # 1 MB write buffer: ~128x fewer write syscalls than the 8 KB default
+    with open(out_path, "wb", buffering=1 << 20) as out:
         for p in paths:
             if not p or not Path(p).exists():
                 continue
-            with open(p, "r", encoding="utf-8") as f:
-                for line in f:
+            for line in iter_jsonl_lines(p):
+                try:
+                    rec = loads(line)
+                except Exception:
+                    continue
+                # store the 20-byte digest, not the 40-char hex string:
+                # half the memory and cheaper set hashing at 100k+ records
+                key = rec.get("sha1")
+                if key:
                     try:
-                        rec = json.loads(line)
-                    except Exception:
-                        continue
-                    key = rec.get("sha1") or rec.get("id")
-                    if key in seen:
-                        continue
-                    seen.add(key)
-                    out.write(json.dumps(rec, ensure_ascii=False) + "\n")
-                    wrote += 1
+                        key = bytes.fromhex(key)
+                    except ValueError:
+                        pass
+                else:
+                    key = rec.get("id")
+                if key in seen:
+                    continue
+                seen.add(key)
+                out.write(dump_line(rec))
+                wrote += 1
     print(f"[combine] wrote {wrote} → {out_path}")
     return out_path
 
 def load_embedded(jsonl_path: str):
-    """Map embedded JSONL to minimal index schema."""
-    docs = []
-    with open(jsonl_path, "r", encoding="utf-8") as f:
-        for line in f:
-            try:
-                rec = json.loads(line)
-            except Exception:
-                continue
-            emb = rec.get("embedding") or rec.get("vector") or rec.get("content_vector")
-            if not emb:
-                continue
-            raw_id = str(rec.get("id", ""))
-            docs.append({
-                "id": sanitize_id(raw_id),
-                "content": (rec.get("content") or rec.get("text") or rec.get("page_content") or "")[:32766],
-                "source": str(rec.get("source") or rec.get("file_name") or "local"),
-                "embedding": emb
-            })
-    print(f"[load] {len(docs)} embedded docs ready")
-    return docs
-
-def upload_all(search_client: SearchClient, docs, batch_size: int = 500):
-    """Upload to Azure in batches."""
-    total = len(docs)
-    for i in range(0, total, batch_size):
-        search_client.upload_documents(docs[i:i+batch_size])
+    """Yield embedded JSONL records mapped to the minimal index schema.
+
+    A generator rather than a list: docs flow straight into upload batches,
+    so peak memory is one batch rather than the whole corpus.
+    """
+    loaded = 0
+    for line in iter_jsonl_lines(jsonl_path):
+        try:
+            rec = loads(line)
+        except Exception:
+            continue
+        emb = rec.get("embedding") or rec.get("vector") or rec.get("content_vector")
+        if not emb:
+            continue
+        if isinstance(emb, str):
+            # base64 float16 bytes from build_embeddings; Azure wants float32
+            emb = np.frombuffer(base64.b64decode(emb), dtype=np.float16).astype(np.float32).tolist()
+        raw_id = str(rec.get("id", ""))
+        loaded += 1
+        yield {
+            "id": sanitize_id(raw_id),
+            "content": (rec.get("content") or rec.get("text") or rec.get("page_content") or "")[:32766],
+            "source": str(rec.get("source") or rec.get("file_name") or "local"),
+            "embedding": emb
+        }
+    print(f"[load] {loaded} embedded docs streamed")
+
+def _upload_batch(search_client: SearchClient, batch, max_retries: int = 5):
+    """Upload one batch; exponential backoff on throttling (429/503)."""
+    delay = 1.0
+    for attempt in range(max_retries):
+        try:
+            search_client.upload_documents(batch)
+            return
+        except HttpResponseError as e:
+            if e.status_code in (429, 503) and attempt < max_retries - 1:
+                time.sleep(delay)
+                delay *= 2
+            else:
+                raise
+
+def upload_all(search_client: SearchClient, docs, batch_size: int = 1000):
+    """Upload to Azure in batches, several in flight at once.
+
+    Each upload call is dominated by network RTT, so a small thread pool
+    (SearchClient is thread-safe for uploads) overlaps that latency.
+    1000 docs is Azure Search's per-request maximum. `docs` may be any
+    iterable (load_embedded streams); only the in-flight batches are held
+    in memory.
+    """
+    total = 0
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        futures, batch = [], []
+        for doc in docs:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                futures.append(ex.submit(_upload_batch, search_client, batch))
+                total += len(batch)
+                batch = []
+                # cap in-flight batches so a slow service can't balloon memory
+                if len(futures) >= 16:
+                    for fut in futures:
+                        fut.result()
+                    futures = []
+        if batch:
+            futures.append(ex.submit(_upload_batch, search_client, batch))
+            total += len(batch)
+        for fut in futures:
+            fut.result()
     print(f"[upload] uploaded {total} docs")
 
 def reset_index():
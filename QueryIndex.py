@@ -1,7 +1,8 @@
-import os 
-from typing import List, Dict, Any 
+import os
+from functools import lru_cache
+from typing import List, Dict, Any
 
-from openai import OpenAI
+from openai_client import client
 from azure.core.credentials import AzureKeyCredential
 from azure.search.documents import SearchClient
 from azure.search.documents.models import VectorizedQuery
@@ -16,22 +17,27 @@ ADMIN_KEY = os.getenv('AZURE_SEARCH_ADMIN_KEY')
 
 EMBED_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small')
 
-client = OpenAI(api_key=os.environ['OPENAI_API_KEY'])
-
 search_client = SearchClient(
     endpoint=ENDPOINT,
     index_name=INDEX_NAME,
     credential=AzureKeyCredential(ADMIN_KEY)
 )
 
+@lru_cache(maxsize=4096)
+def _embed_query(norm_text: str) -> tuple:
+    """Embed a normalized query; cached so repeat queries skip the API RTT."""
+    resp = client.embeddings.create(model=EMBED_MODEL, input=norm_text)
+    return tuple(resp.data[0].embedding)
+
 def search_with_query(query_text: str, k: int = 5) -> List[Dict[str, Any]]:
     """Embeds the query text using OpenAI, sends the vector to Azure, and returns top-k matches."""
     if not query_text or not query_text.strip():
         return []
 
-    # Embed query text using OpenAI
-    resp = client.embeddings.create(model=EMBED_MODEL, input=query_text)
-    query_vector = resp.data[0].embedding  # list of 1536 floats
+    # Embed query text using OpenAI (cached on normalized text, so
+    # "What is NDIS?" and "what is ndis?" hit the same entry)
+    norm_text = " ".join(query_text.lower().split())
+    query_vector = list(_embed_query(norm_text))  # list of 1536 floats
 
     # Build vector search request
     vq = VectorizedQuery(
@@ -2,14 +2,13 @@
 
 import os, sys
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai_client import client as CLIENT
 from QueryIndex import search_with_query
 from pathlib import Path
 
 
 load_dotenv()
 
-CLIENT     = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
 CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o-mini")
 TOP_K      = int(os.getenv("RAG_TOP_K", "5"))
 ORG_NAME    = os.getenv("ORG_NAME", "NDIS")
@@ -103,23 +102,29 @@ def build_context(docs):
     return "\n\n".join(lines)
 
 
-def rag(query: str, k: int = TOP_K) -> str:
-    # retrieve top-k chunks
+def _prepare_messages(query: str, k: int):
+    """Retrieve top-k chunks and build the chat messages; None if no context."""
     docs = search_with_query(query_text=query, k=k) or []
-
-    # Build the context string
     context = build_context(docs)
-
-    # If we have no context, bail early with a clear message
     if not context:
-        return "I don’t have enough context to answer that."
-
-    # Ask the LLM using the system rules and the context
-    messages = [
+        return None
+    return [
         {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "user",   "content": f"Question: {query}\n\nContext:\n{context}"}
     ]
 
+
+NO_CONTEXT_ANSWER = "I don’t have enough context to answer that."
+
+
+def rag(query: str, k: int = TOP_K) -> str:
+    messages = _prepare_messages(query, k)
+
+    # If we have no context, bail early with a clear message
+    if messages is None:
+        return NO_CONTEXT_ANSWER
+
+    # Ask the LLM using the system rules and the context
     resp = CLIENT.chat.completions.create(
         model=CHAT_MODEL,
         messages=messages,
@@ -128,6 +133,25 @@ def rag(query: str, k: int = TOP_K) -> str:
     )
     return (resp.choices[0].message.content or "").strip()
 
+
+def rag_stream(query: str, k: int = TOP_K):
+    """Like rag(), but yields answer text deltas as the model generates them."""
+    messages = _prepare_messages(query, k)
+    if messages is None:
+        yield NO_CONTEXT_ANSWER
+        return
+
+    stream = CLIENT.chat.completions.create(
+        model=CHAT_MODEL,
+        messages=messages,
+        temperature=0.2,
+        max_tokens=400,
+        stream=True,
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
 if __name__ == "__main__":
     q = " ".join(sys.argv[1:]) or input("Q: ").strip()
     print(rag(q))
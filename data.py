@@ -1,12 +1,21 @@
 # Imports
-import json, re, unicodedata, shutil, zipfile
+import os, re, unicodedata, shutil, zipfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import gdown, pandas as pd
 from docx import Document
 from PyPDF2 import PdfReader
+
+# pypdfium2 (PDFium C++ bindings) extracts text 5-20x faster than PyPDF2;
+# fall back to PyPDF2 when it is not installed
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
 import hashlib
 from datetime import datetime, timezone
 
+from jsonl_io import dump_line
 
 
 # Parse text from a Word document
@@ -33,6 +42,16 @@ def parse_pdf(path: Path) -> str:
     except Exception as e:
         print(f"[error-pdf-open] {path} -> {e}")
         return ""
+    if pdfium is not None:
+        try:
+            pdf = pdfium.PdfDocument(str(path))
+            try:
+                raw = "\n".join(page.get_textpage().get_text_range() for page in pdf)
+            finally:
+                pdf.close()
+            return clean_text(raw)
+        except Exception as e:
+            print(f"[error-pdfium] {path} -> {e} (falling back to PyPDF2)")
     try:
         raw = "\n".join((p.extract_text() or "") for p in PdfReader(path).pages)
         return clean_text(raw)
@@ -60,30 +79,34 @@ def parse_excel(path: Path) -> str:
         return ""
 
 
+# Compiled once; clean_text runs per chunk so per-call re.sub cache lookups add up
+_RE_PAGE = re.compile(r"page\s+\d+(\s+of\s+\d+)?", re.I)
+_RE_WS   = re.compile(r"[ \t]+")
+_RE_NL   = re.compile(r"\n{3,}")
+
+
 # Clean and normalize text
 def clean_text(text: str) -> str:
     if not text:
         return ""
     text = unicodedata.normalize("NFKC", text)   # normalize unicode
     text = text.replace("\xa0", " ")             # replace non-breaking spaces
-    text = re.sub(r"page\s+\d+(\s+of\s+\d+)?", "", text, flags=re.I)  # drop page numbers
-    text = re.sub(r"[ \t]+", " ", text)          # collapse multiple spaces/tabs
-    text = re.sub(r"\n{3,}", "\n\n", text)       # collapse 3+ newlines into 2
+    text = _RE_PAGE.sub("", text)                # drop page numbers
+    text = _RE_WS.sub(" ", text)                 # collapse multiple spaces/tabs
+    text = _RE_NL.sub("\n\n", text)              # collapse 3+ newlines into 2
     return text.strip()
 
 
 # Split text into chunks (~1000 chars with 100 overlap)
 def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 100) -> list[str]:
+    # all chunk starts are known up front, so iterate a range instead of
+    # recomputing next_start per iteration in a while loop
+    step = chunk_size - overlap if chunk_size > overlap else chunk_size
     chunks = []
-    start = 0
-    n = len(text)
-    while start < n:
-        end = start + chunk_size
-        chunk = text[start:end].strip()
+    for start in range(0, len(text), step):
+        chunk = text[start:start + chunk_size].strip()
         if chunk:
             chunks.append(chunk)
-        next_start = end - overlap
-        start = next_start if next_start > start else end
     return chunks
 
 
@@ -120,8 +143,13 @@ def make_record(path: Path) -> list[dict] | None:
 
     chunks = chunk_text(text)
     records = []
+    # hash the "path::" prefix once and fork the state per chunk, instead of
+    # re-encoding the concatenated prefix+chunk string for every chunk
+    base = hashlib.sha1(f"{path.resolve()}::".encode("utf-8"))
     for i, chunk in enumerate(chunks, 1):
-        sha1 = hashlib.sha1(f'{path.resolve()}::{chunk}'.encode('utf-8')).hexdigest()
+        h = base.copy()
+        h.update(chunk.encode("utf-8"))
+        sha1 = h.hexdigest()
         records.append({
             "id": f"{path.stem}_{i}",          # unique id = filename + chunk number
             "source_type": ext,
@@ -160,50 +188,56 @@ def prepare_data(file_link: str, work_dir: str = "data") -> Path:
     return work_path
 
 
+# Recursive os.scandir walk; DirEntry caches file-type info from the
+# directory read, so no per-path stat like rglob + is_file()
+def scan_files(dirpath):
+    with os.scandir(dirpath) as it:
+        for e in it:
+            if e.name.startswith("."):   # dotfiles and AppleDouble ._* files
+                continue
+            if e.is_dir(follow_symlinks=False):
+                yield from scan_files(e.path)
+            elif e.is_file():
+                yield e
+
+
 # Loop through files, build JSONL corpus
 def build_corpus(data_dir: str | Path, out_path: str = "out/ndis_parsed.jsonl") -> None:
     data_dir = Path(data_dir)
     out_file = Path(out_path)
     out_file.parent.mkdir(parents=True, exist_ok=True)
 
-    # Gather candidate files then filter out hidden/AppleDouble; allow only .docx/.pdf/.xlsx
-    candidates = [p for p in data_dir.rglob("*") if p.is_file()]
+    # Gather supported files; hidden/AppleDouble entries are filtered on the
+    # raw DirEntry name before any Path object is built
     files = [
-        p for p in candidates
-        if not is_hidden_or_appledouble(p)
-        and p.suffix.lower() in (".docx", ".pdf", ".xlsx")
+        Path(e.path) for e in scan_files(data_dir)
+        if os.path.splitext(e.name)[1].lower() in (".docx", ".pdf", ".xlsx")
     ]
 
-    # quick header sanity to reduce exceptions later
-    docx_ok = sum(1 for p in files if p.suffix.lower() == ".docx" and zipfile.is_zipfile(p))
-    xlsx_ok = sum(1 for p in files if p.suffix.lower() == ".xlsx" and zipfile.is_zipfile(p))
-    pdf_ok  = 0
-    for p in files:
-        if p.suffix.lower() == ".pdf":
-            try:
-                with p.open("rb") as fh:
-                    pdf_ok += (fh.read(5) == b"%PDF-")
-            except Exception:
-                pass
-
-    print(f">>> Found {len(files)} supported files under {data_dir} "
-          f"(docx_ok={docx_ok}, pdf_ok={pdf_ok}, xlsx_ok={xlsx_ok})")
-
+    print(f">>> Found {len(files)} supported files under {data_dir}")
 
     # Write JSONL (one line per chunk)
+    # Parsing (PyPDF2/openpyxl) is CPU-bound pure Python, so fan make_record
+    # out across cores; keep the single writer here in the main process.
+    # Per-type counts come from the parse results themselves — no separate
+    # header prescan pass, which opened and read every file a second time.
     written = 0
     skipped = 0
-    with out_file.open("w", encoding="utf-8") as f:
-        for p in files:
-            recs = make_record(p)
-            if recs:
-                for rec in recs:
-                    f.write(json.dumps(rec, ensure_ascii=False) + "\n")
-                    written += 1
-            else:
-                skipped += 1
-
-    print(f"Wrote JSONL corpus to {out_file} (records={written}, files_skipped={skipped})")
+    parsed_ok = {".docx": 0, ".pdf": 0, ".xlsx": 0}
+    # 1 MB write buffer: ~128x fewer write syscalls than the 8 KB default
+    with out_file.open("wb", buffering=1 << 20) as f:
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+            for p, recs in zip(files, ex.map(make_record, files, chunksize=4)):
+                if recs:
+                    parsed_ok[p.suffix.lower()] += 1
+                    for rec in recs:
+                        f.write(dump_line(rec))
+                        written += 1
+                else:
+                    skipped += 1
+
+    print(f"Wrote JSONL corpus to {out_file} (records={written}, files_skipped={skipped}, "
+          f"docx_ok={parsed_ok['.docx']}, pdf_ok={parsed_ok['.pdf']}, xlsx_ok={parsed_ok['.xlsx']})")
 
 
 # Entry point (runs when is python data.py called)
@@ -1,9 +1,28 @@
 
-import os, json, tempfile
-from openai import OpenAI
+import asyncio, base64, os, sqlite3, tempfile
+import numpy as np
+from openai_client import async_client
+from jsonl_io import dump_line, iter_jsonl_lines, loads
 
 from dotenv import load_dotenv
-load_dotenv()  
+load_dotenv()
+
+# Embeddings persist across runs keyed by (model, chunk sha1), so incremental
+# re-indexing skips the OpenAI round-trip for every unchanged chunk.
+CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "out/embed_cache.sqlite")
+
+
+def _open_cache(path: str = CACHE_PATH) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    db = sqlite3.connect(path)
+    # vectors are stored as float16 bytes (half the size of float32,
+    # negligible recall loss); the table name carries the dtype so stale
+    # float32 caches are simply ignored
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS emb_f16("
+        "model TEXT, sha1 TEXT, vec BLOB, PRIMARY KEY(model, sha1))"
+    )
+    return db
 
 
 def build_embeddings(in_path: str,
@@ -15,42 +34,93 @@ def build_embeddings(in_path: str,
     """
     MODEL = model or os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
     BATCH = int(batch_size or os.getenv("EMBED_BATCH", "16"))
-
-    client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+    CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "16"))
 
     tmp_dir = tempfile.mkdtemp(prefix="embeddings_")
     out_path = os.path.join(tmp_dir, "embedded.jsonl")
 
-    with open(in_path, "r", encoding="utf-8") as fin, open(out_path, "w", encoding="utf-8") as fout:
-        batch_texts, batch_recs = [], []
-
-        def flush_batch():
-            if not batch_texts:
-                return
-            resp = client.embeddings.create(model=MODEL, input=batch_texts)
-            for rec, item in zip(batch_recs, resp.data):
-                rec["embedding"] = item.embedding          
-                rec["embedding_dim"] = len(item.embedding)
-                if "content" not in rec and "text" in rec:
-                    rec["content"] = rec.pop("text")
-                fout.write(json.dumps(rec, ensure_ascii=False) + "\n")
-            batch_texts.clear()
-            batch_recs.clear()
-
-        for line in fin:
-            line = line.strip()
-            if not line:
-                continue
-            rec = json.loads(line)
-            txt = rec.get("text") or rec.get("content")
-            if not txt:
-                continue
-            batch_texts.append(txt)
-            batch_recs.append(rec)
-            if len(batch_texts) >= BATCH:
-                flush_batch()
-        flush_batch()
+    db = _open_cache()
+    cache_hits = 0
+
+    def write_rec(fout, rec, vec16: np.ndarray):
+        # base64 float16 bytes instead of a JSON list of 1536 floats:
+        # ~6x smaller JSONL and proportionally faster to parse downstream
+        rec["embedding"] = base64.b64encode(vec16.tobytes()).decode("ascii")
+        rec["embedding_dim"] = int(vec16.size)
+        if "content" not in rec and "text" in rec:
+            rec["content"] = rec.pop("text")
+        fout.write(dump_line(rec))
+
+    async def run():
+        nonlocal cache_hits
+        client = async_client
+        sem = asyncio.Semaphore(CONCURRENCY)
+
+        async def embed_batch(fout, batch_texts, batch_recs):
+            # embed each distinct text once; duplicate chunks (boilerplate
+            # headers repeated across documents) share the result
+            index, unique_texts, positions = {}, [], []
+            for txt in batch_texts:
+                idx = index.get(txt)
+                if idx is None:
+                    idx = len(unique_texts)
+                    index[txt] = idx
+                    unique_texts.append(txt)
+                positions.append(idx)
+            async with sem:
+                resp = await client.embeddings.create(model=MODEL, input=unique_texts)
+            vecs16 = [np.asarray(item.embedding, dtype=np.float16) for item in resp.data]
+            rows = []
+            for rec, idx in zip(batch_recs, positions):
+                vec16 = vecs16[idx]
+                sha1 = rec.get("sha1")
+                if sha1:
+                    rows.append((MODEL, sha1, vec16.tobytes()))
+                write_rec(fout, rec, vec16)
+            if rows:
+                db.executemany("INSERT OR REPLACE INTO emb_f16 VALUES(?,?,?)", rows)
+                db.commit()
+
+        # 1 MB write buffer: ~128x fewer write syscalls than the 8 KB default
+        with open(out_path, "wb", buffering=1 << 20) as fout:
+            tasks = []
+            batch_texts, batch_recs = [], []
+            for line in iter_jsonl_lines(in_path):
+                rec = loads(line)
+                txt = rec.get("text") or rec.get("content")
+                if not txt:
+                    continue
+                sha1 = rec.get("sha1")
+                if sha1:
+                    row = db.execute(
+                        "SELECT vec FROM emb_f16 WHERE model=? AND sha1=?", (MODEL, sha1)
+                    ).fetchone()
+                    if row:
+                        write_rec(fout, rec, np.frombuffer(row[0], dtype=np.float16))
+                        cache_hits += 1
+                        continue
+                batch_texts.append(txt)
+                batch_recs.append(rec)
+                if len(batch_texts) >= BATCH:
+                    tasks.append(asyncio.create_task(embed_batch(fout, batch_texts, batch_recs)))
+                    batch_texts, batch_recs = [], []
+                    # keep memory bounded: don't queue far ahead of the pool
+                    if len(tasks) >= CONCURRENCY * 2:
+                        done, pending = await asyncio.wait(
+                            tasks, return_when=asyncio.FIRST_COMPLETED
+                        )
+                        for t in done:
+                            t.result()  # surface errors
+                        tasks = list(pending)
+            if batch_texts:
+                tasks.append(asyncio.create_task(embed_batch(fout, batch_texts, batch_recs)))
+            if tasks:
+                await asyncio.gather(*tasks)
+
+    asyncio.run(run())
 
+    db.close()
+    print(f"Embedding cache hits: {cache_hits} ({CACHE_PATH})")
     print(f"Embeddings temp folder → {tmp_dir}")
     print(f"Embedded JSONL → {out_path}")
     return tmp_dir, out_path
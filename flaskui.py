@@ -1,14 +1,122 @@
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, request, jsonify
 from dotenv import load_dotenv
-from RAGLLM import rag
-from threading import Thread
+from functools import lru_cache
+import gzip, hashlib, json
+from pathlib import Path
+from RAGLLM import rag, rag_stream
+from threading import Lock, Thread
 from werkzeug.serving import make_server
-from markdown import markdown
+from markdown import Markdown
+import queue
 import re
 from urllib.parse import urlparse
 
 load_dotenv()
 
+# compiled once; _fix_bullets runs on every answer
+_RE_BLANKS3 = re.compile(r"\n{3,}")
+_RE_LONE_BULLET = re.compile(r"(?m)^[ \t]*[-*•][ \t]*$")
+_RE_TRAIL_WS = re.compile(r"[ \t]+\n")
+# a bullet marker alone on a line, blank lines, then content -> "- content"
+_RE_DANGLING = re.compile(r"(?m)^[ \t]*[-*•][ \t]*\n(?:[ \t]*\n)*[ \t]*(\S.*)$")
+
+# one Markdown instance: the extension registry and processor regexes are
+# built once, and reset() just clears per-document state between converts.
+# convert() mutates that per-document state, so the reset+convert pair is
+# serialized under a lock — the server runs multiple threads and lru_cache
+# does not stop concurrent misses from rendering at the same time
+_MD = Markdown(extensions=["fenced_code", "tables", "sane_lists"], output_format="html5")
+_MD_LOCK = Lock()
+
+
+def _fix_bullets(text: str) -> str:
+    # most answers have no dangling bullet markers; one compiled regex scan
+    # decides that without touching the rewrite patterns
+    text = _RE_TRAIL_WS.sub("\n", text)
+    if _RE_LONE_BULLET.search(text):
+        # merge "marker line, blank lines, content" into one "- content" line,
+        # then drop any marker left with nothing to attach to (end of text)
+        text = _RE_DANGLING.sub(r"- \1", text)
+        text = _RE_LONE_BULLET.sub("", text)
+    return _RE_BLANKS3.sub("\n\n", text).strip()
+
+
+# candidate keys hoisted so _collect_refs doesn't rebuild the tuples per call
+_LIST_KEYS  = ("refs", "sources", "documents", "context", "chunks")
+_URL_KEYS   = ("url", "link", "source", "href")
+_TITLE_KEYS = ("title", "name", "doc_title")
+_PAGE_KEYS  = ("page", "page_number", "pg")
+
+def _first(it: dict, keys: tuple):
+    for k in keys:
+        v = it.get(k)
+        if v:
+            return v
+    return None
+
+def _collect_refs(r: dict) -> list[dict]:
+    if not isinstance(r, dict):
+        return []
+    for key in _LIST_KEYS:
+        val = r.get(key)
+        if isinstance(val, list):
+            out = []
+            for it in val:
+                if isinstance(it, dict):
+                    url = _first(it, _URL_KEYS)
+                    title = _first(it, _TITLE_KEYS) or url
+                    page = _first(it, _PAGE_KEYS)
+                    out.append({"url": url, "title": (title or "").strip(), "page": page})
+            if out:
+                return out
+    return []
+
+
+# One dedicated RAG worker thread: HTTP handler threads enqueue the query and
+# block on a reply queue, so many requests can be in flight in the web layer
+# while the model-side pipeline (embed -> search -> LLM) runs serialized on
+# its own thread instead of contending inside every handler.
+_rag_queue: queue.Queue = queue.Queue()
+
+def _rag_worker():
+    while True:
+        q, reply = _rag_queue.get()
+        try:
+            reply.put(rag(q))
+        except Exception as e:       # hand the error back to the waiting handler
+            reply.put(e)
+
+Thread(target=_rag_worker, daemon=True).start()
+
+def _rag_via_queue(q: str):
+    reply = queue.Queue(1)
+    _rag_queue.put((q, reply))
+    result = reply.get()
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+# The rag() round-trip (embed + vector search + LLM) is seconds; repeat
+# queries are the hot head of the distribution, so cache whole answers on
+# the normalized query. Failures raise and are therefore never cached.
+@lru_cache(maxsize=1024)
+def _rag_cached(q_norm: str):
+    return _rag_via_queue(q_norm)
+
+
+# FAQ-style answers repeat a lot, and the bullet fixup + markdown render is
+# the CPU-heavy part of a request once rag() has returned — memoize it
+@lru_cache(maxsize=512)
+def _render_answer(answer_text: str, refs_key: tuple) -> str:
+    clean_text = _fix_bullets(answer_text)
+    with _MD_LOCK:
+        _MD.reset()
+        answer_html = _MD.convert(clean_text)
+    if refs_key:
+        refs = [{"url": u, "title": t, "page": p} for u, t, p in refs_key]
+        answer_html = _link_citations(answer_html, refs)
+    return answer_html
+
 def create_app() -> Flask:
     app = Flask(__name__)
 
@@ -109,7 +217,11 @@ def create_app() -> Flask:
           box.scrollTop = box.scrollHeight;
         }
 
-        async function ask(){
+        function escapeHtml(s){
+          return s.replace(/&/g,'&amp;').replace(/</g,'&lt;').replace(/>/g,'&gt;');
+        }
+
+        function ask(){
           const q = (qEl.value || '').trim();
           if(!q) return;
 
@@ -119,23 +231,37 @@ def create_app() -> Flask:
 
           chatHistory.push({ role: 'assistant', content: 'Thinking...' });
           renderChat();
+          const idx = chatHistory.length - 1;
 
-          try{
-            const res  = await fetch('/api/plan', {
-              method: 'POST',
-              headers: {'Content-Type':'application/json'},
-              body: JSON.stringify({ query: q })
-            });
-            const data = await res.json();
-            const content = data?.answer_html || data?.answer || 'Error';
-            chatHistory[chatHistory.length - 1] = { role: 'assistant', content };
-          }catch(e){
-            chatHistory[chatHistory.length - 1] = {
-              role: 'assistant',
-              content: 'Network or server error: ' + e
-            };
-          }
-          renderChat();
+          // stream tokens over SSE so the answer appears as it is generated
+          let acc = '';
+          const es = new EventSource('/api/plan/stream?q=' + encodeURIComponent(q));
+          es.onmessage = (ev) => {
+            const data = JSON.parse(ev.data);
+            if (data.delta) {
+              acc += data.delta;
+              chatHistory[idx] = { role: 'assistant', content: escapeHtml(acc) };
+              renderChat();
+            }
+            if (data.answer_html) {
+              chatHistory[idx] = { role: 'assistant', content: data.answer_html };
+              renderChat();
+            }
+            if (data.done || data.error) {
+              if (data.error) {
+                chatHistory[idx] = { role: 'assistant', content: 'Error: ' + escapeHtml(data.error) };
+                renderChat();
+              }
+              es.close();
+            }
+          };
+          es.onerror = () => {
+            if (!acc) {
+              chatHistory[idx] = { role: 'assistant', content: 'Network or server error' };
+              renderChat();
+            }
+            es.close();
+          };
         }
 
         btn.addEventListener('click', ask);
@@ -150,49 +276,36 @@ def create_app() -> Flask:
     </html>
     """
 
+    # PAGE has no template variables, so Jinja is pure overhead here —
+    # encode and gzip it once at startup and serve the constant bytes
+    page_bytes = PAGE.encode("utf-8")
+    page_gzip = gzip.compress(page_bytes, compresslevel=6)
+    page_etag = hashlib.md5(page_bytes).hexdigest()
+
+    # Materialize the page under static/ as well, so a fronting web server
+    # (nginx with expires/gzip_static) can serve it with zero Python involved;
+    # the pure-Flask path below uses the same file for non-gzip clients.
+    static_dir = Path(app.static_folder or "static")
+    static_dir.mkdir(parents=True, exist_ok=True)
+    (static_dir / "index.html").write_bytes(page_bytes)
+
     @app.get("/")
     def home():
-        return render_template_string(PAGE)
-
-    def _fix_bullets(text: str) -> str:
-        lines = [l.rstrip() for l in text.splitlines()]
-        out = []
-        i = 0
-        while i < len(lines):
-            cur = lines[i].strip()
-            if cur in {"-", "*", "•"}:
-                j = i + 1
-                while j < len(lines) and lines[j].strip() == "":
-                    j += 1
-                if j < len(lines):
-                    out.append("- " + lines[j].lstrip())
-                    i = j + 1
-                    continue
-                else:
-                    i = j
-                    continue
-            out.append(lines[i])
-            i += 1
-        text = "\n".join(out)
-        text = re.sub(r"\n{3,}", "\n\n", text)
-        return text.strip()
-
-    def _collect_refs(r: dict) -> list[dict]:
-        if not isinstance(r, dict):
-            return []
-        for key in ("refs", "sources", "documents", "context", "chunks"):
-            val = r.get(key)
-            if isinstance(val, list):
-                out = []
-                for it in val:
-                    if isinstance(it, dict):
-                        url = it.get("url") or it.get("link") or it.get("source") or it.get("href")
-                        title = it.get("title") or it.get("name") or it.get("doc_title") or url
-                        page = it.get("page") or it.get("page_number") or it.get("pg")
-                        out.append({"url": url, "title": (title or "").strip(), "page": page})
-                if out:
-                    return out
-        return []
+        # Vary on both branches: the response is negotiated on Accept-Encoding
+        # and cacheable, so shared caches must not hand the gzip body to a
+        # client that didn't ask for it. Each representation also gets its own
+        # ETag (the "-gzip" suffix vs send_static_file's mtime-based one).
+        if "gzip" in request.headers.get("Accept-Encoding", "").lower():
+            resp = Response(page_gzip, mimetype="text/html")
+            resp.headers["Content-Encoding"] = "gzip"
+            resp.headers["Cache-Control"] = "public, max-age=3600"
+            resp.headers["Vary"] = "Accept-Encoding"
+            resp.set_etag(f"{page_etag}-gzip")
+            return resp.make_conditional(request)
+        resp = app.send_static_file("index.html")
+        resp.headers["Cache-Control"] = "public, max-age=3600"
+        resp.headers["Vary"] = "Accept-Encoding"
+        return resp
 
     @app.post("/api/plan")
     def plan():
@@ -202,27 +315,52 @@ def create_app() -> Flask:
         if not q:
             return jsonify({"error": "Please provide 'query'"}), 400
 
-        result = rag(q)
+        q_norm = " ".join(q.lower().split())
+        result = _rag_cached(q_norm)
         if isinstance(result, dict):
             answer_text = result.get("answer") or result.get("output") or result.get("text") or str(result)
         else:
             answer_text = str(result)
 
-        clean_text = _fix_bullets(answer_text)
-        answer_html = markdown(clean_text, extensions=["fenced_code", "tables", "sane_lists"])
-
         refs = _collect_refs(result) if isinstance(result, dict) else []
-        if refs:
-            answer_html = _link_citations(answer_html, refs)
+        refs_key = tuple((r["url"], r["title"], r.get("page")) for r in refs)
+        answer_html = _render_answer(answer_text, refs_key)
 
         return jsonify({"answer": answer_text, "answer_html": answer_html}), 200
 
+    @app.get("/api/plan/stream")
+    def plan_stream():
+        # Server-Sent Events: the browser shows tokens as they arrive, so
+        # perceived latency is time-to-first-token, not full generation time.
+        # Streams bypass the RAG worker queue — the point is to overlap
+        # generation with rendering, not to serialize behind other queries.
+        q = (request.args.get("q") or "").strip()
+        if not q:
+            return jsonify({"error": "Please provide 'q'"}), 400
+
+        def events():
+            parts = []
+            try:
+                for delta in rag_stream(q):
+                    parts.append(delta)
+                    yield f"data: {json.dumps({'delta': delta})}\n\n"
+                answer_text = "".join(parts).strip()
+                answer_html = _render_answer(answer_text, ())
+                yield f"data: {json.dumps({'answer_html': answer_html, 'done': True})}\n\n"
+            except Exception as e:
+                yield f"data: {json.dumps({'error': str(e)})}\n\n"
+
+        return Response(events(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
     return app
 
 class Server(Thread):
     def __init__(self, app: Flask, host: str = "0.0.0.0", port: int = 8000):
         super().__init__(daemon=True)
-        self._srv = make_server(host, port, app)
+        # threaded=True: slow RAG calls overlap instead of serializing every
+        # request behind a single handler thread
+        self._srv = make_server(host, port, app, threaded=True)
         self._ctx = app.app_context()
         self._ctx.push()
 
@@ -240,4 +378,10 @@ def start_server(host: str = "0.0.0.0", port: int = 8000) -> Server:
 
 if __name__ == "__main__":
     app = create_app()
-    app.run(host="0.0.0.0", port=8000, debug=False)
+    try:
+        # production WSGI server: thread pool + HTTP keep-alive, unlike the
+        # werkzeug dev server which pays a TCP handshake per request
+        from waitress import serve
+        serve(app, host="0.0.0.0", port=8000, threads=8)
+    except ImportError:
+        app.run(host="0.0.0.0", port=8000, debug=False)
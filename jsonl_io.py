@@ -0,0 +1,47 @@
+# Shared JSONL plumbing for the pipeline scripts
+# (data.py, webscrape.py, embeddings.py, IndexingAzureAISearch.py).
+import json
+
+# orjson parses/serializes JSONL lines several times faster than stdlib json;
+# fall back to json so the pipeline still runs without it
+try:
+    import orjson
+
+    def loads(line):
+        return orjson.loads(line)
+
+    def dump_line(rec) -> bytes:
+        return orjson.dumps(rec) + b"\n"
+except ImportError:
+    def loads(line):
+        return json.loads(line)
+
+    def dump_line(rec) -> bytes:
+        return (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def iter_jsonl_lines(path):
+    """Yield raw JSONL lines as bytes.
+
+    Reads big binary blocks and splits on newlines with bytes.find instead of
+    iterating a text-mode file, skipping per-line str creation and UTF-8 decode.
+    """
+    with open(path, "rb", buffering=1 << 20) as f:
+        carry = b""
+        while True:
+            block = f.read(1 << 16)
+            if not block:
+                break
+            buf = carry + block if carry else block
+            start = 0
+            while True:
+                nl = buf.find(b"\n", start)
+                if nl == -1:
+                    break
+                line = buf[start:nl]
+                if line:
+                    yield line
+                start = nl + 1
+            carry = buf[start:]
+        if carry.strip():
+            yield carry
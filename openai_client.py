@@ -0,0 +1,23 @@
+# Shared OpenAI clients for the whole process.
+# embeddings.py, QueryIndex.py and RAGLLM.py each built their own client,
+# so every module paid its own TLS handshakes; routing them through one
+# sync and one async client keeps a single warm keep-alive pool.
+import os
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+from dotenv import load_dotenv
+load_dotenv()
+
+_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+
+client = OpenAI(
+    api_key=os.environ["OPENAI_API_KEY"],
+    http_client=httpx.Client(limits=_LIMITS),
+)
+
+async_client = AsyncOpenAI(
+    api_key=os.environ["OPENAI_API_KEY"],
+    http_client=httpx.AsyncClient(limits=_LIMITS),
+)
@@ -1,11 +1,24 @@
 # webscrape_ndis.py
-import os, json, time, hashlib, re
+import os, time, hashlib, re, threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlsplit, urlparse
+from urllib.parse import urljoin, urlsplit
+from urllib.robotparser import RobotFileParser
+
+# lxml is a C extension, typically 3-10x faster than the pure-Python parser;
+# fall back so the crawler still runs without it
+try:
+    import lxml  # noqa: F401
+    SOUP_PARSER = "lxml"
+except ImportError:
+    SOUP_PARSER = "html.parser"
 import requests
 from dotenv import load_dotenv
 
+from jsonl_io import dump_line
+
 load_dotenv()
 
 # Config 
@@ -13,29 +26,39 @@ START_URL            = os.getenv("SCRAPE_URL", "https://www.ndis.gov.au")
 OUT_PATH             = os.getenv("WEB_PARSED_JSONL_PATH", "out/web_parsed.jsonl")
 CRAWLER_MAX_PAGES    = int(os.getenv("CRAWLER_MAX_PAGES", "5"))   # pages, not chunks
 CRAWLER_DELAY_SEC    = float(os.getenv("CRAWLER_DELAY_SEC", "0.3"))
+CRAWLER_MAX_INFLIGHT = int(os.getenv("CRAWLER_MAX_INFLIGHT", "8"))  # concurrent fetches
 
 # Hard caps to stay within Azure Free quotas
 MAX_BYTES            = int(os.getenv("MAX_BYTES", "2000000"))      # ~2 MB per page
 MAX_TEXT_CHARS       = int(os.getenv("MAX_TEXT_CHARS", "20000"))   # trim very long pages
 
 # Skip downloading these file types (These files have been donwloaded/chunked in data.py)
-SKIP_EXT = {
-    ".pdf",".doc",".docx",".xls",".xlsx",".ppt",".pptx",".zip",
-    ".jpg",".jpeg",".png",".gif",".svg",".webp",".mp4",".webm",
-    ".json",".xml",".rss",".ics",".apk",".csv",".txt"
-}
-
-def is_html_url(link: str, start_url: str) -> bool:
-    """Same-host, non-binary, no fragments."""
+# One compiled regex scan per link beats ~25 Python-level endswith calls
+_SKIP_EXT_RE = re.compile(
+    r"\.(pdf|docx?|xlsx?|pptx?|zip|jpe?g|png|gif|svg|webp|mp4|webm|json|xml|rss|ics|apk|csv|txt)$",
+    re.I,
+)
+
+# compiled once; clean_text runs per page
+_RE_BLANKS2 = re.compile(r"\n{2,}")
+
+# boilerplate tags stripped before text extraction; a set gives O(1) name
+# matching during the single find_all traversal
+_STRIP_TAGS = {"script", "style", "nav", "footer", "header", "noscript"}
+
+def is_html_url(link: str, start_netloc: str) -> bool:
+    """Same-host, non-binary, no fragments.
+
+    Takes the already-lowercased start netloc so the start URL is parsed once
+    per crawl, not once per link; urlsplit skips urlparse's params handling.
+    """
     try:
-        u = urlparse(link)
-        s = urlparse(start_url)
+        u = urlsplit(link)
         # same host (or relative)
-        if u.netloc and u.netloc != s.netloc:
+        if u.netloc and u.netloc.lower() != start_netloc:
             return False
         # skip known non-html extensions
-        path = (u.path or "").lower()
-        if any(path.endswith(ext) for ext in SKIP_EXT):
+        if _SKIP_EXT_RE.search(u.path or ""):
             return False
         # avoid in-page anchors
         if u.fragment:
@@ -44,56 +67,109 @@ def is_html_url(link: str, start_url: str) -> bool:
     except:
         return False
 
-# Cleaning & Chunking 
-def clean_text(html: str) -> str:
-    """Remove boilerplate and keep readable text."""
-    soup = BeautifulSoup(html, "html.parser")
-    for tag in soup(["script", "style", "nav", "footer", "header", "noscript"]):
+# Cleaning & Chunking
+def clean_text(soup: BeautifulSoup) -> str:
+    """Remove boilerplate and keep readable text.
+
+    Takes an already-parsed soup (mutating it) so callers parse each page once
+    and reuse the tree for link extraction.
+    """
+    for tag in soup.find_all(_STRIP_TAGS):
         tag.decompose()
     text = soup.get_text("\n", strip=True)
-    return re.sub(r"\n{2,}", "\n\n", text)
+    return _RE_BLANKS2.sub("\n\n", text)
 
 def chunk_text(text: str, max_chars: int = 1500, overlap: int = 200):
-    """Split into chunks with small overlap."""
-    chunks, start = [], 0
-    n = len(text)
-    while start < n:
-        end = min(start + max_chars, n)
-        chunk = text[start:end].strip()
+    """Split into chunks with small overlap.
+
+    Chunk starts are a fixed stride, so iterate a precomputed range. The old
+    while loop recomputed start from a clamped end and got stuck re-emitting
+    the final chunk forever once end reached len(text) (start pinned at
+    len(text) - overlap), for any page longer than max_chars.
+    """
+    step = max_chars - overlap if max_chars > overlap else max_chars
+    chunks = []
+    for start in range(0, len(text), step):
+        chunk = text[start:start + max_chars].strip()
         if chunk:
             chunks.append(chunk)
-        start = end - overlap
-        if start < 0:
-            break
     return chunks
 
-# Fetching 
-def scrape_page(url: str) -> tuple[str, BeautifulSoup | None]:
+# Fetching
+# one Session so TCP+TLS connections are pooled across pages; advertise what
+# we actually want so servers can 406/redirect extension-less binary URLs
+# before we download the body
+_USER_AGENT = "NDIS-Assistant-Crawler/1.0"
+_SESSION = requests.Session()
+_SESSION.headers.update({
+    "Accept": "text/html,application/xhtml+xml",
+    "Accept-Encoding": "gzip, deflate",
+    "User-Agent": _USER_AGENT,
+})
+
+# robots.txt parsed once per host
+_robots_cache: dict = {}
+
+def robots_allowed(url: str) -> bool:
+    u = urlsplit(url)
+    key = (u.scheme, u.netloc)
+    rp = _robots_cache.get(key)
+    if rp is None:
+        rp = RobotFileParser(f"{u.scheme}://{u.netloc}/robots.txt")
+        try:
+            rp.read()
+        except Exception:
+            rp.allow_all = True   # unreachable robots.txt: crawl politely anyway
+        _robots_cache[key] = rp
+    return rp.can_fetch(_USER_AGENT, url)
+
+def scrape_page(url: str) -> tuple[str, list | None]:
     """
-    Fetch a page safely and return (clean_text, soup) for link extraction.
+    Fetch a page safely and return (clean_text, hrefs) for link extraction.
     Returns ("", None) for non-HTML or failures.
+
+    Single streamed GET instead of HEAD+GET: the content-type is checked on
+    the response headers and the body read is aborted past MAX_BYTES, so
+    non-HTML and oversized pages cost one round-trip and bounded memory.
+    The page is parsed once; hrefs are pulled out before clean_text strips
+    nav/header/footer so no links are lost.
     """
     try:
-        # quick HEAD to validate content-type & size (when provided)
-        h = requests.head(url, timeout=10, allow_redirects=True)
-        ctype = h.headers.get("Content-Type", "")
-        if "text/html" not in ctype:
-            return "", None
-        clen = h.headers.get("Content-Length")
-        if clen and int(clen) > MAX_BYTES:
-            return "", None
-
-        r = requests.get(url, timeout=10)
-        if "text/html" not in r.headers.get("Content-Type", ""):
-            return "", None
-
-        soup = BeautifulSoup(r.text, "html.parser")
-        text = clean_text(r.text)[:MAX_TEXT_CHARS]
-        return text, soup
+        with _SESSION.get(url, timeout=10, stream=True) as r:
+            if "text/html" not in r.headers.get("Content-Type", ""):
+                return "", None
+            buf = bytearray()
+            for chunk in r.iter_content(65536):
+                buf.extend(chunk)
+                if len(buf) > MAX_BYTES:
+                    return "", None
+            html = bytes(buf).decode(r.encoding or "utf-8", errors="replace")
+
+        soup = BeautifulSoup(html, SOUP_PARSER)
+        hrefs = [a["href"] for a in soup.find_all("a", href=True)]
+        text = clean_text(soup)[:MAX_TEXT_CHARS]
+        return text, hrefs
     except Exception as e:
         print(f"Failed to scrape {url}: {e}")
         return "", None
 
+
+# Global rate limit: fetch workers reserve a start slot CRAWLER_DELAY_SEC
+# apart, so concurrency overlaps latency without hammering the host harder
+# than the old one-sleep-per-page loop did.
+_rate_lock = threading.Lock()
+_next_fetch_at = 0.0
+
+def _fetch(url: str):
+    global _next_fetch_at
+    with _rate_lock:
+        now = time.monotonic()
+        wait_s = _next_fetch_at - now
+        _next_fetch_at = max(now, _next_fetch_at) + CRAWLER_DELAY_SEC
+    if wait_s > 0:
+        time.sleep(wait_s)
+    return url, scrape_page(url)
+
 #  Crawl driver (counts PAGES, not chunks) 
 def crawl_website(start_url: str, max_pages: int = 10, out_path: str = "out/web_parsed.jsonl"):
     """
@@ -102,56 +178,82 @@ def crawl_website(start_url: str, max_pages: int = 10, out_path: str = "out/web_
     - Skips binaries and large pages.
     """
     os.makedirs(Path(out_path).parent, exist_ok=True)
-    visited, to_visit = set(), [start_url]
+    start_netloc = urlsplit(start_url).netloc.lower()  # parsed once per crawl
+    visited = set()
+    to_visit = deque([start_url])       # deque: O(1) popleft vs list.pop(0)
+    enqueued = {start_url}              # don't push the same URL twice
     pages_written = 0
     chunks_written = 0
     seen_chunks = set()  # dedupe identical chunk bodies across pages
 
-    with open(out_path, "w", encoding="utf-8") as f:
-        while to_visit and pages_written < max_pages:
-            url = to_visit.pop(0)
-            if url in visited:
-                continue
-            visited.add(url)
-
-            print(f"Scraping: {url}")
-            text, soup = scrape_page(url)
-            if not text or soup is None:
-                # nothing useful; do not count this as a page
-                time.sleep(CRAWLER_DELAY_SEC)
-                continue
-
-            # Fewer, larger chunks reduce Azure vector/doc counts
-            for i, chunk in enumerate(chunk_text(text, max_chars=2500, overlap=100), 1):
-                # stable hash on content to avoid dup writes
-                h = hashlib.sha1(chunk.encode("utf-8")).hexdigest()
-                if h in seen_chunks:
-                    continue
-                seen_chunks.add(h)
-
-                # make ID unique per-path + chunk index
-                path_part = urlsplit(url).path or "/"
-                rec = {
-                    "id": f"{urlsplit(url).netloc}{path_part}#{i}",
-                    "source_type": "web",
-                    "file_name": path_part if path_part != "/" else "index.html",
-                    "file_type": "html",
-                    "path": url,
-                    "text": chunk,
-                    "sha1": h,
-                }
-                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
-                chunks_written += 1
-
-            pages_written += 1  # ← count pages once per fetched URL
-
-            # enqueue new same-domain HTML links (reuse the soup we already parsed)
-            for a in soup.find_all("a", href=True):
-                link = urljoin(url, a["href"])
-                if is_html_url(link, start_url) and link not in visited:
-                    to_visit.append(link)
-
-            time.sleep(CRAWLER_DELAY_SEC)
+    # Fetches run in a thread pool (I/O-bound; the rate limiter in _fetch keeps
+    # request spacing); parsing, JSONL writes and frontier updates all happen
+    # here in the main thread, so no locks are needed around them.
+    # Write to a temp file with a 1 MB buffer, fsync once at the end, then
+    # atomically replace — readers never see a half-written crawl.
+    tmp_path = f"{out_path}.tmp"
+    with open(tmp_path, "wb", buffering=1 << 20) as f:
+        with ThreadPoolExecutor(max_workers=CRAWLER_MAX_INFLIGHT) as ex:
+            in_flight = set()
+            while (to_visit or in_flight) and pages_written < max_pages:
+                # top up in-flight fetches, staying within the page budget
+                while (to_visit and len(in_flight) < CRAWLER_MAX_INFLIGHT
+                       and pages_written + len(in_flight) < max_pages):
+                    url = to_visit.popleft()
+                    if url in visited:
+                        continue
+                    visited.add(url)
+                    if not robots_allowed(url):
+                        print(f"Skipping (robots.txt): {url}")
+                        continue
+                    print(f"Scraping: {url}")
+                    in_flight.add(ex.submit(_fetch, url))
+
+                if not in_flight:
+                    break
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+
+                for fut in done:
+                    url, (text, hrefs) = fut.result()
+                    if not text or hrefs is None:
+                        # nothing useful; do not count this as a page
+                        continue
+
+                    # Fewer, larger chunks reduce Azure vector/doc counts
+                    for i, chunk in enumerate(chunk_text(text, max_chars=2500, overlap=100), 1):
+                        # stable hash on content to avoid dup writes; dedup needs
+                        # no crypto strength, and blake2b is 2-3x faster than sha1
+                        h = hashlib.blake2b(chunk.encode("utf-8"), digest_size=16).hexdigest()
+                        if h in seen_chunks:
+                            continue
+                        seen_chunks.add(h)
+
+                        # make ID unique per-path + chunk index
+                        path_part = urlsplit(url).path or "/"
+                        rec = {
+                            "id": f"{urlsplit(url).netloc}{path_part}#{i}",
+                            "source_type": "web",
+                            "file_name": path_part if path_part != "/" else "index.html",
+                            "file_type": "html",
+                            "path": url,
+                            "text": chunk,
+                            "sha1": h,
+                        }
+                        f.write(dump_line(rec))
+                        chunks_written += 1
+
+                    pages_written += 1  # ← count pages once per fetched URL
+
+                    # enqueue new same-domain HTML links (from the single page parse)
+                    for href in hrefs:
+                        link = urljoin(url, href)
+                        if link not in enqueued and is_html_url(link, start_netloc):
+                            enqueued.add(link)
+                            to_visit.append(link)
+
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, out_path)
 
     print(f"Saved {pages_written} pages ({chunks_written} chunks) to {out_path}")
     return out_path